@@ -0,0 +1,228 @@
+
+import server
+from things import dist, MARGIN, CAN_BUILD, CAN_COLONISE
+from tasks import Task
+
+"""
+
+Hierarchical Planning
+-------------------------------------------------------------------------------
+The flat planner looks at every task for every asset, even though Task.issue
+ends up merging most nearby assets into a single flagship fleet anyway. In
+hierarchical mode (--hierarchical) planning happens in two levels.
+
+ * Coarse - assets within ASSEMBLE_DISTANCE of each other are grouped into
+   clusters and so are the tasks. Asset clusters are then linked to the
+   closest task clusters until what the task clusters need (power and
+   colonisers) has been covered, or the asset cluster has nothing to spare,
+   or it has LINKS links. Task clusters nobody can spare anything for are
+   left until next turn.
+ * Fine - each asset only considers the tasks in the task clusters linked to
+   its own cluster, using the normal assignment.
+
+So the coarse work grows with the number of clusters and the fine work with
+the size of the clusters rather than the whole universe.
+
+With --hierarchical=compare the flat planner is also run and the quality of
+the two plans is reported.
+"""
+
+# How many ships an asset which can build is counted as
+BUILDS = 4
+# Most task clusters an asset cluster is linked to
+LINKS  = 8
+
+class Cluster(object):
+	"""\
+	A group of assets or tasks which are close together.
+
+	members,	The assets or tasks in the cluster
+	centre,		The average position of the members
+	power,		Power which is needed (tasks) or available (assets)
+	colonisers,	Colonisers which are needed (tasks) or available (assets)
+	"""
+	def __init__(self, members, positions):
+		self.members = members
+		self.centre  = tuple([sum(p)/float(len(p)) for p in zip(*positions)])
+
+		self.power      = 0.0
+		self.colonisers = 0
+		self.links      = []
+
+	def __str__(self):
+		return "<Cluster of %i at %s>" % (len(self.members), self.centre)
+	__repr__ = __str__
+
+def cluster(things, position, distance):
+	"""\
+	Returns lists of the things which are within distance of each other.
+	"""
+	def cell(pos):
+		return tuple([int(x // distance) for x in pos])
+
+	positions = [position(thing) for thing in things]
+
+	grid = {}
+	for i, pos in enumerate(positions):
+		grid.setdefault(cell(pos), []).append(i)
+
+	parent = range(len(things))
+	def find(i):
+		while parent[i] != i:
+			parent[i] = parent[parent[i]]
+			i = parent[i]
+		return i
+
+	for (x, y, z), members in grid.items():
+		for dx in (-1, 0, 1):
+			for dy in (-1, 0, 1):
+				for dz in (-1, 0, 1):
+					for j in grid.get((x+dx, y+dy, z+dz), []):
+						for i in members:
+							if i < j and dist(positions[i], positions[j]) <= distance:
+								parent[find(i)] = find(j)
+
+	groups = {}
+	for i in range(len(things)):
+		groups.setdefault(find(i), []).append(i)
+	return [Cluster([things[i] for i in g], [positions[i] for i in g]) for g in groups.values()]
+
+class Plan(object):
+	"""\
+	The coarse plan, which tasks each asset should consider.
+	"""
+	def __init__(self, assets, tasks):
+		distance = server.ASSEMBLE_DISTANCE
+
+		self.assets = cluster(assets, lambda a: a.ref.pos, distance)
+		self.tasks  = cluster(tasks,  lambda t: t.ref.pos[0], distance)
+
+		# What each cluster has
+		for c in self.assets:
+			for asset in c.members:
+				mask = asset.capabilities()
+
+				c.power += asset.power()
+				if mask & CAN_COLONISE:
+					c.colonisers += 1
+				if mask & CAN_BUILD:
+					c.power      += BUILDS*server.BATTLESHIP_POWER
+					c.colonisers += BUILDS
+
+		# What each cluster needs
+		for c in self.tasks:
+			for task in c.members:
+				if task.type in (Task.DESTROY, Task.TAKEOVER):
+					c.power += task.ref.threat()[0] + MARGIN
+				if task.type in (Task.COLONISE, Task.TAKEOVER):
+					c.colonisers += 1
+
+		self.link()
+
+		self.lookup = {}
+		for c in self.assets:
+			tasks = []
+			for t in c.links:
+				tasks.extend(t.members)
+			for asset in c.members:
+				self.lookup[asset.ref.id] = tasks
+
+	def link(self):
+		"""\
+		Link asset clusters to the closest task clusters they can help with.
+		"""
+		pairs = []
+		for a in self.assets:
+			for t in self.tasks:
+				pairs.append((dist(a.centre, t.centre), a, t))
+		pairs.sort()
+
+		power      = dict([(c, c.power) for c in self.assets + self.tasks])
+		colonisers = dict([(c, c.colonisers) for c in self.assets + self.tasks])
+
+		for d, a, t in pairs:
+			if len(a.links) >= LINKS:
+				continue
+
+			usepower  = power[a] > 0 and power[t] > 0
+			usecolony = colonisers[a] > 0 and colonisers[t] > 0
+			if not (usepower or usecolony):
+				continue
+
+			a.links.append(t)
+			if usepower:
+				supply = min(power[a], power[t])
+				power[a] -= supply
+				power[t] -= supply
+			if usecolony:
+				supply = min(colonisers[a], colonisers[t])
+				colonisers[a] -= supply
+				colonisers[t] -= supply
+
+		# Every asset cluster should have something to do
+		for d, a, t in pairs:
+			if len(a.links) == 0:
+				a.links.append(t)
+
+	def candidates(self, asset):
+		"""\
+		Returns the tasks this asset should consider.
+		"""
+		return self.lookup[asset.ref.id]
+
+	def report(self):
+		links = sum([len(c.links) for c in self.assets])
+		print "%i assets in %i clusters, %i tasks in %i clusters, %i links" % \
+			(sum([len(c.members) for c in self.assets]), len(self.assets),
+			 sum([len(c.members) for c in self.tasks]), len(self.tasks), links)
+
+def quality(tasks):
+	"""\
+	Returns how good the assignment of the tasks is as a dictionary.
+
+	assigned,	Tasks with something assigned to them
+	complete,	Tasks which are 100% assigned
+	portion,	The total portion assigned (each task counts at most 100)
+	turns,		The average number of turns the complete tasks will take
+	"""
+	assigned = [task for task in tasks if len(task.fulfilments()) > 0]
+	complete = [task for task in assigned if task.portion() >= 100]
+
+	turns = None
+	if len(complete) > 0:
+		turns = sum([task.long() for task in complete])/len(complete)
+
+	return {
+		'assigned': len(assigned),
+		'complete': len(complete),
+		'portion':  sum([min(task.portion(), 100) for task in assigned]),
+		'turns':    turns,
+	}
+
+def save(tasks):
+	"""\
+	Remember the assignment of the tasks, so it can be restored.
+	"""
+	return [(task, [role.fulfilment for role in task.roles], list(task.auxiliary)) for task in tasks]
+
+def restore(saved):
+	for task, roles, auxiliary in saved:
+		for role, fulfilment in zip(task.roles, roles):
+			role.fulfilment = fulfilment
+		task.auxiliary = auxiliary
+
+def report(hierarchical, flat):
+	"""\
+	Print the quality of the hierarchical plan against the flat plan, each
+	is (quality, seconds taken).
+	"""
+	print "                  hierarchical        flat"
+	for name in ('assigned', 'complete', 'portion', 'turns'):
+		values = []
+		for q, taken in (hierarchical, flat):
+			if q[name] is None:
+				values.append("         -")
+			else:
+				values.append("%10.1f" % q[name])
+		print "  %-14s  %s  %s" % (name, values[0], values[1])
+	print "  %-14s  %9.2fs  %9.2fs" % ('time', hierarchical[1], flat[1])
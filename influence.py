@@ -0,0 +1,226 @@
+
+import math
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+import server
+
+
+"""
+
+The Influence Map
+-------------------------------------------------------------------------------
+Working out how much a threat is reinforced by the threats around it (or how
+safe a place is) by comparing every pair of objects is O(n^2). Instead the
+power of every enemy and friendly object is splatted onto a grid covering the
+universe and the grid is blurred once, after which the influence at any
+position is a single lookup.
+
+ * An object influences everything within ASSEMBLE_DISTANCE (a few turns of
+   travel), so the cells are sized from that rather than the size of the
+   universe. A flat universe gets a flat grid.
+ * The blur is a [1, 2, 1] kernel applied PASSES times along each axis, so an
+   object influences the cells up to PASSES cells away. On a universe too big
+   for MAXCELLS cells a side the cells get bigger and the blur more passes.
+ * The blur is linear, so when only a few objects have moved since the last
+   turn their old influence is subtracted and the new added in place instead
+   of rebuilding the grid.
+
+The map requires numpy, without it the AI plans as if there were no
+reinforcements.
+"""
+
+ENEMY    = 0
+FRIENDLY = 1
+
+# Blur passes (and so cells) to cover ASSEMBLE_DISTANCE
+PASSES   = 2
+# Most cells along any side of the grid
+MAXCELLS = 128
+
+# Rebuild rather than patch the map if more than this fraction has changed
+REBUILD = 0.25
+
+def kernel(passes):
+	"""\
+	Returns the 1D blur kernel applied along each axis.
+	"""
+	k = numpy.array([1.0])
+	for i in range(passes):
+		k = numpy.convolve(k, [0.25, 0.5, 0.25])
+	return k
+
+class Influence(object):
+	"""\
+	A grid of how much enemy and friendly power can reach each place.
+
+	entries,	Dictionary of id -> (layer, position, power) splatted on the grid
+	"""
+	def __init__(self, entries):
+		self.entries = dict(entries)
+
+		if len(entries) > 0:
+			positions = numpy.array([pos for layer, pos, power in entries.values()], dtype=float)
+			low, high = positions.min(axis=0), positions.max(axis=0)
+		else:
+			low, high = numpy.zeros(3), numpy.zeros(3)
+
+		extent      = high - low
+		reach       = float(server.ASSEMBLE_DISTANCE)
+		self.size   = max(reach/PASSES, extent.max()/MAXCELLS, 1.0)
+		self.passes = int(math.ceil(reach/self.size))
+
+		# Leave room for things to move around a bit
+		self.origin = low - self.size*self.passes*(extent > 0)
+		self.shape  = tuple([int(x) for x in numpy.ceil(extent/self.size)])
+		self.shape  = tuple([s + 1 + 2*self.passes for s in self.shape])
+		self.shape  = tuple([[s, 1][int(e == 0)] for s, e in zip(self.shape, extent)])
+
+		k = kernel(self.passes)
+		self.stamp = numpy.ones([1]*3)
+		for axis in range(3):
+			if self.shape[axis] == 1:
+				continue
+			s = [1]*3
+			s[axis] = len(k)
+			self.stamp = self.stamp*k.reshape(s)
+
+		self.raw     = numpy.zeros((2,) + self.shape)
+		self.blurred = numpy.zeros((2,) + self.shape)
+
+		if len(entries) > 0:
+			layers = numpy.array([layer for layer, pos, power in entries.values()])
+			powers = numpy.array([power for layer, pos, power in entries.values()], dtype=float)
+			cells  = self.cells(positions)
+			numpy.add.at(self.raw, (layers, cells[:,0], cells[:,1], cells[:,2]), powers)
+
+		self.blur()
+
+	def cells(self, positions):
+		"""\
+		Returns the grid cells for an array of positions.
+		"""
+		c = numpy.round((numpy.asarray(positions, dtype=float) - self.origin)/self.size).astype(int)
+		return numpy.clip(c, 0, numpy.array(self.shape) - 1)
+
+	def cell(self, pos):
+		return tuple(self.cells([pos])[0])
+
+	def covers(self, pos):
+		c = (numpy.asarray(pos, dtype=float) - self.origin)/self.size
+		return bool(numpy.all(c >= 0) and numpy.all(c <= numpy.array(self.shape) - 1))
+
+	def blur(self):
+		"""\
+		Recalculate the blurred grid from the raw grid.
+		"""
+		grid = self.raw.copy()
+		for axis in range(1, 4):
+			if grid.shape[axis] == 1:
+				continue
+
+			for i in range(self.passes):
+				pad = [(0, 0)]*4
+				pad[axis] = (1, 1)
+				p = numpy.pad(grid, pad, mode='constant')
+
+				def shifted(start):
+					s = [slice(None)]*4
+					s[axis] = slice(start, start+grid.shape[axis])
+					return p[tuple(s)]
+
+				grid = 0.25*shifted(0) + 0.5*shifted(1) + 0.25*shifted(2)
+		self.blurred = grid
+
+	def splat(self, layer, pos, power):
+		"""\
+		Add (or with negative power remove) influence without a full blur.
+		"""
+		c = self.cell(pos)
+		self.raw[(layer,) + c] += power
+
+		region = []
+		kernel = []
+		for axis in range(3):
+			r = self.stamp.shape[axis]//2
+			lo, hi = c[axis]-r, c[axis]+r+1
+			region.append(slice(max(lo, 0), min(hi, self.shape[axis])))
+			kernel.append(slice(max(lo, 0)-lo, self.stamp.shape[axis]-(hi-min(hi, self.shape[axis]))))
+		self.blurred[(layer,) + tuple(region)] += power*self.stamp[tuple(kernel)]
+
+	def patch(self, entries):
+		"""\
+		Update the map to the given entries, returns False if too much has
+		changed (or moved off the map) and the map should be rebuilt.
+		"""
+		changed = []
+		for id in set(self.entries.keys()) | set(entries.keys()):
+			if self.entries.get(id, None) != entries.get(id, None):
+				changed.append(id)
+
+		if len(changed) > REBUILD*max(len(entries), 1):
+			return False
+		for id in changed:
+			if entries.has_key(id) and not self.covers(entries[id][1]):
+				return False
+
+		for id in changed:
+			if self.entries.has_key(id):
+				layer, pos, power = self.entries.pop(id)
+				self.splat(layer, pos, -power)
+			if entries.has_key(id):
+				layer, pos, power = self.entries[id] = entries[id]
+				self.splat(layer, pos, power)
+		return True
+
+	def at(self, layer, pos):
+		"""\
+		Returns the influence of a layer at a position.
+		"""
+		if not self.covers(pos):
+			return 0.0
+		return float(self.blurred[(layer,) + self.cell(pos)])
+
+	def own(self, power):
+		"""\
+		Returns how much of an object's power is felt in its own cell.
+		"""
+		return power*self.stamp.max()
+
+	def threat(self, pos):
+		return self.at(ENEMY, pos)
+
+	def safety(self, pos):
+		return self.at(FRIENDLY, pos) - self.at(ENEMY, pos)
+
+	def reinforcement(self, pos, power):
+		"""\
+		Returns how much enemy power (other than the object's own) could
+		help an object at this position.
+		"""
+		return max(self.at(ENEMY, pos) - self.own(power), 0.0)
+
+def update(influence, assets, threats):
+	"""\
+	Returns an influence map for the assets and threats, updating the given
+	map in place if only a few things have changed.
+	"""
+	if numpy is None:
+		return None
+
+	entries = {}
+	for asset in assets:
+		power = asset.power()
+		if power > 0:
+			entries[asset.ref.id] = (FRIENDLY, tuple(asset.ref.pos), power)
+	for threat in threats:
+		power = threat.power()
+		if power > 0:
+			entries[threat.refs[0].id] = (ENEMY, tuple(threat.refs[0].pos), power)
+
+	if not influence is None and influence.patch(entries):
+		return influence
+	return Influence(entries)
@@ -0,0 +1,185 @@
+
+import server
+
+"""
+
+The Ledger
+-------------------------------------------------------------------------------
+The ledger keeps running totals of what we own, what our enemies own and what
+we have queued to build, so the status report does not have to walk the
+universe and every order each turn.
+
+ * Planets and ships are counted as each object is classified.
+ * Queued ships are tracked per build order. Orders we create or remove update
+   the totals through the CacheDirtyEvents in OrderCreate/OrderRemove, orders
+   which changed on the server (for example a build finishing) are picked up
+   when the object's modify time no longer matches what the ledger has seen.
+"""
+
+class Holdings(object):
+	"""\
+	The planets and ships owned by one side.
+
+	ships,		Dictionary of design id -> number of ships
+	"""
+	def __init__(self):
+		self.reset()
+
+	def reset(self):
+		self.planets = 0
+		self.ships   = {}
+
+	def add(self, ref):
+		if ref._subtype == server.FLEET_TYPE:
+			for shipid, amount in ref.ships:
+				self.ships[shipid] = self.ships.get(shipid, 0) + amount
+		if ref._subtype == server.PLANET_TYPE:
+			self.planets += 1
+
+	def status(self):
+		ships = {}
+		for shipid, amount in self.ships.items():
+			ships[server.cache.designs[shipid].name] = amount
+		return {'planets': self.planets, 'ships': ships}
+
+class Ledger(object):
+	"""\
+	Running totals for the status report.
+
+	mine,		Holdings for our empire
+	enemy,		Holdings for everyone else
+	queued,		Dictionary of ship name -> number being built
+	builds,		Dictionary of object id -> per order slot {ship name: amount}
+	seen,		Dictionary of object id -> modify time when builds was read
+	"""
+	def __init__(self):
+		self.mine   = Holdings()
+		self.enemy  = Holdings()
+
+		self.names  = {}
+		self.queued = {}
+		self.builds = {}
+		self.seen   = {}
+
+	def reset(self):
+		"""\
+		Start counting a new turn.
+		"""
+		self.mine.reset()
+		self.enemy.reset()
+
+	def contribution(self, order):
+		"""\
+		Returns what a single order has queued.
+		"""
+		if order is None or order.subtype != server.BUILDFLEET_ORDER:
+			return None
+
+		tonames, tobuild = order.ships
+
+		c = {}
+		for id, amount in tobuild:
+			if not self.names.has_key(id):
+				for tid, name, max in tonames:
+					self.names[tid] = name
+			name = self.names[id]
+			c[name] = c.get(name, 0) + amount
+		return c
+
+	def _queue(self, c, sign):
+		if c is None:
+			return
+		for name, amount in c.items():
+			self.queued[name] = self.queued.get(name, 0) + sign*amount
+			if self.queued[name] == 0:
+				del self.queued[name]
+
+	def sync(self, ref):
+		"""\
+		Update the queued totals for an object we own if its orders have
+		changed on the server.
+		"""
+		if self.builds.has_key(ref.id) and self.seen[ref.id] == ref.modify_time:
+			return
+
+		self.read(ref.id)
+		self.seen[ref.id] = ref.modify_time
+
+	def read(self, oid):
+		"""\
+		Recount what an object has queued from the orders in the cache.
+		"""
+		for c in self.builds.get(oid, []):
+			self._queue(c, -1)
+
+		self.builds[oid] = []
+		for order in server.cache.orders.get(oid, []):
+			c = self.contribution(order)
+			self.builds[oid].append(c)
+			self._queue(c, 1)
+
+	def prune(self, ids):
+		"""\
+		Forget about any objects we no longer own.
+		"""
+		for oid in self.builds.keys():
+			if not oid in ids:
+				for c in self.builds.pop(oid):
+					self._queue(c, -1)
+				del self.seen[oid]
+
+	def apply(self, evt):
+		"""\
+		Update the queued totals from a CacheDirtyEvent which has been applied.
+		"""
+		if evt.what != "orders" or not self.builds.has_key(evt.id):
+			return
+
+		builds = self.builds[evt.id]
+
+		# The cache has already been changed, if we are out of step with it
+		# just count the object again
+		if len(builds) != len(server.cache.orders.get(evt.id, [])) + \
+				[0, 1][evt.action == "remove"] - [0, 1][evt.action == "create"]:
+			self.read(evt.id)
+			return
+
+		if evt.action in ("remove", "change"):
+			self._queue(builds.pop(evt.slot), -1)
+
+		if evt.action in ("create", "change"):
+			c = self.contribution(evt.change)
+			builds.insert(evt.slot, c)
+			self._queue(c, 1)
+
+	def status(self):
+		"""\
+		Returns the ledger as a dictionary suitable for metrics.
+		"""
+		return {
+			'mine':   self.mine.status(),
+			'enemy':  self.enemy.status(),
+			'queued': dict(self.queued),
+		}
+
+	def report(self):
+		status = self.status()
+
+		def ships(ships):
+			for name, amount in ships.items():
+				print "  %6i %s%s" % (amount, name, ['', 's'][amount > 1])
+
+		print "My total empire is:"
+		print "  %6i Planets" % status['mine']['planets']
+		ships(status['mine']['ships'])
+
+		if len(status['queued']) > 0:
+			print
+			print "I have queued:"
+			ships(status['queued'])
+
+		print
+		print "The total enemies are:"
+		print "  %6i Planets" % status['enemy']['planets']
+		ships(status['enemy']['ships'])
+		print
@@ -0,0 +1,163 @@
+
+from tp.netlib import failed
+
+"""
+
+Message Processing
+-------------------------------------------------------------------------------
+The server leaves messages on our boards every turn. Most of them are noise
+but a few tell us things which the universe does not, for example
+
+ * combat reports, which objects were involved in a battle,
+ * colonisation reports, which planets changed hands,
+ * loss reports, which objects have been destroyed.
+
+Threats which keep turning up in these reports are sent more force (see
+Threat.threat).
+
+The messages are read straight from the server a chunk at a time (before the
+cache is updated) and each one is handed to the Intel object as it arrives.
+Once a board has been read every message on it is removed with one request,
+so the cache never has to download them.
+
+With the "discard" policy the message bodies are never downloaded at all, the
+board header tells us how many messages there are and they are all removed.
+"""
+
+STREAM  = "stream"
+DISCARD = "discard"
+POLICIES = (STREAM, DISCARD)
+
+# How many messages to request at once
+CHUNK = 50
+
+# The reference type the server uses to point at an object
+OBJECT_REFERENCE = 1
+
+COMBAT    = "combat"
+COLONISED = "colonised"
+LOST      = "lost"
+
+# FIXME: These are ruleset specific, the server only gives us free text...
+KEYWORDS = (
+	(COMBAT,    ("combat", "battle", "attacked")),
+	(COLONISED, ("colonised", "colonized", "colonisation")),
+	(LOST,      ("destroyed", "lost")),
+)
+
+class Intel(object):
+	"""\
+	Facts about objects which have been gathered from the messages.
+
+	events,		Dictionary of object id -> list of (turn, kind)
+	memory,		How many turns an event is remembered for
+	"""
+	def __init__(self, memory=10):
+		self.turn   = 0
+		self.memory = memory
+		self.events = {}
+
+	def next(self):
+		"""\
+		Start a new turn, forgetting any events which are too old.
+		"""
+		self.turn += 1
+
+		oldest = self.turn - self.memory
+		for oid, events in self.events.items():
+			events = [e for e in events if e[0] > oldest]
+			if len(events) > 0:
+				self.events[oid] = events
+			else:
+				del self.events[oid]
+
+	def record(self, kind, oid):
+		self.events.setdefault(oid, []).append((self.turn, kind))
+
+	def count(self, oid, kind=None):
+		"""\
+		How many times has this object been involved in an event of this kind.
+		"""
+		if not self.events.has_key(oid):
+			return 0
+		if kind is None:
+			return len(self.events[oid])
+		return len([e for e in self.events[oid] if e[1] == kind])
+
+	def read(self, message):
+		"""\
+		Extract the facts from a message, returns the kinds found.
+		"""
+		text = ("%s %s" % (message.subject, message.body)).lower()
+
+		kinds = []
+		for kind, words in KEYWORDS:
+			for word in words:
+				if word in text:
+					kinds.append(kind)
+					break
+
+		if len(kinds) == 0:
+			return kinds
+
+		for type, value in getattr(message, 'references', []):
+			if type != OBJECT_REFERENCE:
+				continue
+			for kind in kinds:
+				self.record(kind, value)
+
+		return kinds
+
+def boards(connection, cache):
+	"""\
+	Returns the headers for all the boards we should read.
+	"""
+	# On the first turn we only know about our own board
+	ids = cache.boards.keys()
+	if len(ids) == 0:
+		ids = [0]
+
+	r = connection.get_boards(ids=ids)
+	if failed(r):
+		print "Unable to get the boards (%s)..." % r[1]
+		return []
+	return r
+
+def ingest(connection, cache, intel, policy=STREAM):
+	"""\
+	Read and remove the messages on all our boards.
+
+	Returns a dictionary of board id -> number of messages removed.
+	"""
+	if not policy in POLICIES:
+		raise ValueError("Unknown message policy %s" % policy)
+
+	intel.next()
+
+	removed = {}
+	for board in boards(connection, cache):
+		no = board.number
+		if no == 0:
+			continue
+
+		if policy == STREAM:
+			for start in range(0, no, CHUNK):
+				r = connection.get_messages(board.id, slots=range(start, min(start+CHUNK, no)))
+				if failed(r):
+					print "Unable to get messages from board %i (%s)..." % (board.id, r[1])
+					break
+
+				for message in r:
+					intel.read(message)
+
+		r = connection.remove_messages(board.id, slots=range(0, no))
+		if failed(r):
+			print "Unable to remove messages from board %i (%s)..." % (board.id, r[1])
+			continue
+		removed[board.id] = no
+
+		# Keep the cache in step with the server
+		if cache.messages.has_key(board.id):
+			del cache.messages[board.id][:]
+
+	return removed
@@ -0,0 +1,149 @@
+
+import server
+from things import Asset, Threat, Neutral
+from tasks import Task
+
+"""
+
+The Pipeline
+-------------------------------------------------------------------------------
+Downloading the universe takes a long time, so rather than waiting for it to
+finish before doing anything the objects are classified as they arrive.
+
+The cache calls our callback while it downloads. Every so often the pipeline
+looks for objects which have arrived since it last looked and,
+
+ * classifies them as an Asset, Threat or Neutral,
+ * merges threats which are at the same location,
+ * creates the tasks for threats and neutral planets.
+
+Objects which were already in the cache before the update started might be
+replaced by the download, so they are left until the download has finished.
+
+The pipeline can only classify objects once it knows who we are and what the
+object types are, until then the objects are left for finish().
+"""
+
+# How many callbacks to wait before looking for new objects
+BATCH = 64
+
+class Pipeline(object):
+	"""\
+	Classifies objects as the universe is downloaded.
+
+	assets,		The objects we control
+	threats,	The objects which can hurt us (merged by location)
+	neutrals,	The objects nobody owns
+	tasks,		The tasks which need to be done
+	"""
+	def __init__(self, cache, streaming=True):
+		self.cache = cache
+
+		self.pid = None
+		if len(cache.players) > 0:
+			self.pid = cache.players[0].id
+		self.streaming = streaming and not self.pid is None
+
+		self.assets   = []
+		self.threats  = []
+		self.neutrals = []
+		self.tasks    = []
+
+		# Location -> (Threat, index of the Threat's task)
+		self.located = {}
+
+		# Objects which were in the cache before we started
+		self.stale = dict(cache.objects.items())
+		# Objects which have been classified
+		self.done  = {}
+
+		self.calls = 0
+		self.wait  = BATCH
+
+		server.ledger.reset()
+
+	def callback(self, *args, **kw):
+		"""\
+		Called by the cache while it is downloading.
+		"""
+		if not self.streaming:
+			return
+
+		self.calls += 1
+		if self.calls < self.wait:
+			return
+		self.calls = 0
+
+		for id, object in self.cache.objects.items():
+			if object is self.stale.get(id, None) or self.done.has_key(id):
+				continue
+			self.feed(object)
+
+		# Look less often as the universe grows
+		self.wait = max(BATCH, len(self.done)/4)
+
+	def finish(self):
+		"""\
+		Classify anything which hasn't been classified yet.
+		"""
+		if self.pid is None:
+			self.pid = self.cache.players[0].id
+
+		for id, object in self.cache.objects.items():
+			if self.done.has_key(id):
+				continue
+			self.feed(object)
+
+		# The orders are only downloaded after the objects
+		for asset in self.assets:
+			server.ledger.sync(asset.ref)
+		server.ledger.prune(set([asset.ref.id for asset in self.assets]))
+
+		self.stale = {}
+
+	def feed(self, object):
+		"""\
+		Classify a single object.
+		"""
+		self.done[object.id] = object
+
+		if not hasattr(object, 'owner'):
+			return
+
+		if object.owner in (0, -1):
+			neutral = Neutral([object])
+			self.neutrals.append(neutral)
+
+			# For each neutral we want to colonise the planets
+			if object._subtype == server.PLANET_TYPE:
+				self.tasks.append(Task.COLONISE(neutral))
+
+		elif object.owner == self.pid:
+			asset = Asset([object])
+			self.assets.append(asset)
+
+			server.ledger.mine.add(object)
+
+		else:
+			server.ledger.enemy.add(object)
+
+			# Merge threats at the same location
+			pos = tuple(object.pos)
+			if self.located.has_key(pos):
+				threat, i = self.located[pos]
+				threat.refs.append(object)
+
+				# A planet needs to be taken over rather than destroyed
+				if object._subtype == server.PLANET_TYPE and self.tasks[i].type != Task.TAKEOVER:
+					self.tasks[i] = Task.TAKEOVER(threat)
+				return
+
+			threat = Threat([object])
+			self.threats.append(threat)
+
+			# For each threat, we need to eliminate it or take it over
+			if object._subtype == server.PLANET_TYPE:
+				self.tasks.append(Task.TAKEOVER(threat))
+			else:
+				self.tasks.append(Task.DESTROY(threat))
+			self.located[pos] = (threat, len(self.tasks)-1)
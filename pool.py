@@ -0,0 +1,195 @@
+
+import sys
+import time
+import threading
+import traceback
+
+import server
+
+"""
+
+The Connection Pool
+-------------------------------------------------------------------------------
+On a slow link issuing the orders for hundreds of assets one after another
+can take longer than the turn. The pool logs in a number of extra
+connections for the same account and issues the orders for different tasks
+on them at the same time.
+
+ * Tasks which share an object are issued one after another by the same
+   worker, so the orders on any one object are still changed strictly in
+   order.
+ * The results are applied to the shared cache while holding server.lock.
+ * Anything printed while a task is issued is buffered and written out in one
+   go so the output of different tasks doesn't get mixed together.
+"""
+
+def groups(tasks, keys):
+	"""\
+	Split the tasks into groups where no two groups share a key.
+	"""
+	parent = range(len(tasks))
+	def find(i):
+		while parent[i] != i:
+			parent[i] = parent[parent[i]]
+			i = parent[i]
+		return i
+
+	owner = {}
+	for i, task in enumerate(tasks):
+		for key in keys(task):
+			if owner.has_key(key):
+				parent[find(i)] = find(owner[key])
+			else:
+				owner[key] = i
+
+	r = {}
+	for i, task in enumerate(tasks):
+		r.setdefault(find(i), []).append(task)
+	return r.values()
+
+class Output(object):
+	"""\
+	Buffers the output of each worker thread.
+	"""
+	def __init__(self, stream):
+		self.stream = stream
+		self.local  = threading.local()
+		self.lock   = threading.Lock()
+
+	def start(self):
+		self.local.buffer = []
+
+	def end(self):
+		self.lock.acquire()
+		try:
+			self.stream.write("".join(self.local.buffer))
+		finally:
+			self.lock.release()
+		self.local.buffer = None
+
+	def write(self, s):
+		buffer = getattr(self.local, 'buffer', None)
+		if buffer is None:
+			self.stream.write(s)
+		else:
+			buffer.append(s)
+
+	def flush(self):
+		self.stream.flush()
+
+class Worker(object):
+	"""\
+	A connection in the pool and how much it has done.
+	"""
+	def __init__(self, connection):
+		self.connection = connection
+
+		self.tasks  = 0
+		self.events = 0
+		self.busy   = 0.0
+
+	def apply(self, evt):
+		self.events += 1
+		return self.connection.apply(evt)
+
+	def throughput(self):
+		"""\
+		Returns the number of orders changed per second.
+		"""
+		if self.busy == 0:
+			return 0.0
+		return self.events/self.busy
+
+	def run(self, queue, lock, job, used, errors, output):
+		server.local.connection = self
+		try:
+			while True:
+				lock.acquire()
+				try:
+					if len(queue) == 0:
+						break
+					group = queue.pop(0)
+				finally:
+					lock.release()
+
+				r = []
+				for task in group:
+					start = time.time()
+					output.start()
+					try:
+						r += job(task)
+					finally:
+						output.end()
+						self.busy  += time.time() - start
+						self.tasks += 1
+
+				lock.acquire()
+				try:
+					used.extend(r)
+				finally:
+					lock.release()
+		except Exception, e:
+			errors.append(sys.exc_info())
+		del server.local.connection
+
+		# We don't care about anything the server told this connection
+		del self.connection.buffered['frames-async'][:]
+
+class Pool(object):
+	"""\
+	A pool of connections for issuing orders.
+	"""
+	def __init__(self, connections):
+		self.workers = [Worker(c) for c in connections]
+
+	def __len__(self):
+		return len(self.workers)
+
+	def issue(self, tasks, job, keys):
+		"""\
+		Call job(task) for each task spread over the pool, returns the
+		combined list of used assets.
+
+		keys(task) returns the objects the task changes the orders of.
+		"""
+		queue  = groups(list(tasks), keys)
+		lock   = threading.Lock()
+		used   = []
+		errors = []
+
+		for worker in self.workers:
+			worker.tasks, worker.events, worker.busy = 0, 0, 0.0
+
+		output = Output(sys.stdout)
+		sys.stdout = output
+		try:
+			threads = []
+			for worker in self.workers:
+				t = threading.Thread(target=worker.run, args=(queue, lock, job, used, errors, output))
+				t.start()
+				threads.append(t)
+
+			for t in threads:
+				t.join()
+		finally:
+			sys.stdout = output.stream
+
+		if len(errors) > 0:
+			for info in errors[1:]:
+				traceback.print_exception(*info)
+			raise errors[0][0], errors[0][1], errors[0][2]
+
+		return used
+
+	def status(self):
+		"""\
+		Returns the work done by each connection as a list of dictionaries.
+		"""
+		return [{'tasks': w.tasks, 'events': w.events, 'busy': w.busy, 'throughput': w.throughput()} \
+			for w in self.workers]
+
+	def report(self):
+		print "Connection pool of %i connections:" % len(self)
+		for i, s in enumerate(self.status()):
+			print "  %2i: %4i tasks %6i orders in %6.2fs (%.1f orders/s)" % \
+				(i, s['tasks'], s['events'], s['busy'], s['throughput'])
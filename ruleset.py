@@ -0,0 +1,184 @@
+
+import os
+import pickle
+
+from tp.netlib import failed, objects
+
+import server
+
+"""
+
+Server Profiles
+-------------------------------------------------------------------------------
+All the numbers the AI uses to plan (object types, order types, ship speeds,
+build times and power) depend on the ruleset the server is running.
+
+The first time we connect to a server the ruleset is detected and the numbers
+are worked out from the order descriptions and the ship designs. The profile
+is then saved to disk, keyed by the server and the ruleset version, so later
+runs can load it at startup and skip the discovery.
+
+Anything which can't be worked out keeps the default found in server.py.
+"""
+
+VERSION = 1
+
+DIRECTORY = os.path.expanduser(os.path.join("~", ".tpsai-py", "profiles"))
+
+# The values in server.py which are part of a profile
+CONSTANTS = (
+	'PLANET_TYPE', 'FLEET_TYPE',
+	'MOVE_ORDER', 'BUILDFLEET_ORDER', 'COLONISE_ORDER', 'MERGEFLEET_ORDER',
+	'FRIGATE_SPEED', 'BATTLESHIP_SPEED',
+	'FRIGATE_BUILD', 'BATTLESHIP_BUILD',
+	'FRIGATE_POWER', 'BATTLESHIP_POWER',
+	'ASSEMBLE_DISTANCE',
+)
+
+# Design property names which hold the values we want
+PROPERTIES = {
+	'SPEED': ('speed',),
+	'BUILD': ('buildtime', 'build time'),
+	'POWER': ('damage', 'firepower', 'attack'),
+}
+
+def detect(connection):
+	"""\
+	Returns the (ruleset, version) the server is running.
+	"""
+	if hasattr(connection, 'games'):
+		r = connection.games()
+		if not failed(r) and len(r) > 0:
+			return r[0].rule, r[0].rulever
+	return "unknown", "0"
+
+class Profile(object):
+	"""\
+	The server specific values for a single ruleset.
+
+	host,		The server the profile was discovered on
+	rule,		The name of the ruleset
+	rulever,	The version of the ruleset
+	values,		Dictionary of server.py name -> value
+	"""
+	def __init__(self, host, rule, rulever):
+		self.version = VERSION
+		self.host    = host
+		self.rule    = rule
+		self.rulever = rulever
+		self.values  = {}
+
+		self.discovered = False
+
+	def __str__(self):
+		return "<Profile %s (%s %s) %i values>" % (self.host, self.rule, self.rulever, len(self.values))
+	__repr__ = __str__
+
+	def filename(self):
+		key = "%s-%s-%s" % (self.host, self.rule, self.rulever)
+		return os.path.join(DIRECTORY, key.replace(os.sep, '_') + ".profile")
+
+	def complete(self):
+		"""\
+		Has this profile been discovered?
+		"""
+		return self.discovered
+
+	def apply(self):
+		"""\
+		Make this profile the one the AI uses.
+		"""
+		for name, value in self.values.items():
+			setattr(server, name, value)
+
+	def discover(self, cache):
+		"""\
+		Work out the values from the order descriptions and designs in the
+		cache, anything we can't find keeps its current value.
+		"""
+		for name in CONSTANTS:
+			self.values[name] = getattr(server, name)
+
+		# Object types
+		for object in cache.objects.values():
+			s = "%s_TYPE" % object.__class__.__name__.upper()
+			if s in CONSTANTS:
+				self.values[s] = object._subtype
+
+		# Order types
+		for id, orderdesc in objects.OrderDescs().items():
+			s = "%s_ORDER" % orderdesc._name.replace(' ', '').upper()
+			if s in CONSTANTS:
+				self.values[s] = id
+			else:
+				print "Unknown order", orderdesc
+
+		# Ship designs
+		found = {}
+		for design in cache.designs.values():
+			for propid, value in getattr(design, 'properties', []):
+				if not cache.properties.has_key(propid):
+					continue
+
+				name = cache.properties[propid].name.lower()
+				for what, names in PROPERTIES.items():
+					if not name in names:
+						continue
+					try:
+						found["%s_%s" % (design.name.upper(), what)] = float(value)
+					except (TypeError, ValueError):
+						pass
+
+		for ship in ('FRIGATE', 'BATTLESHIP'):
+			if found.has_key('%s_SPEED' % ship):
+				self.values['%s_SPEED' % ship] = found['%s_SPEED' % ship]
+			if found.has_key('%s_BUILD' % ship):
+				self.values['%s_BUILD' % ship] = int(found['%s_BUILD' % ship])
+
+		# Power is relative to a battleship
+		if found.get('BATTLESHIP_POWER', 0) > 0 and found.has_key('FRIGATE_POWER'):
+			self.values['FRIGATE_POWER'] = \
+				self.values['BATTLESHIP_POWER']*found['FRIGATE_POWER']/found['BATTLESHIP_POWER']
+
+		self.values['ASSEMBLE_DISTANCE'] = self.values['BATTLESHIP_SPEED'] * 4.0
+
+		for name in CONSTANTS:
+			if self.values[name] is None:
+				print "WARNING: The server doesn't seem to have a value for %s" % name
+		self.discovered = True
+
+	def save(self):
+		if not os.path.exists(DIRECTORY):
+			os.makedirs(DIRECTORY)
+
+		f = open(self.filename(), 'wb')
+		try:
+			pickle.dump(self, f, pickle.HIGHEST_PROTOCOL)
+		finally:
+			f.close()
+
+def load(connection, host):
+	"""\
+	Returns the profile for the server's ruleset, loading it from disk if it
+	has been discovered before.
+	"""
+	rule, rulever = detect(connection)
+	profile = Profile(host, rule, rulever)
+
+	filename = profile.filename()
+	if os.path.exists(filename):
+		f = open(filename, 'rb')
+		try:
+			try:
+				saved = pickle.load(f)
+			except Exception, e:
+				print "Unable to load the profile %s (%s)" % (filename, e)
+				saved = None
+		finally:
+			f.close()
+
+		if getattr(saved, 'version', None) == VERSION:
+			profile = saved
+			profile.apply()
+
+	return profile
@@ -0,0 +1,156 @@
+
+import time
+import random
+
+"""
+
+The Scheduler
+-------------------------------------------------------------------------------
+The AI waits a while after a turn starts before playing so that a number of
+AIs on one server don't all hit it at once. How long it can wait depends on
+how long the turn is going to take to play, which grows with the universe.
+
+After each turn the scheduler records how long each phase took,
+
+ * sync,	reading the messages and downloading the universe,
+ * plan,	classifying the objects and assigning the tasks,
+ * submit,	issuing the orders and sending turn finished,
+
+and fits a line (time = a + b*size) to the last few turns for each phase. The
+AI then sleeps for a random time which still leaves the predicted time plus a
+safety margin before the deadline, or starts immediately if there isn't any
+time to spare.
+"""
+
+PHASES = ('sync', 'plan', 'submit')
+
+# How many turns to learn from
+WINDOW = 20
+# Always leave this many seconds spare
+MARGIN = 10.0
+# And this fraction of the predicted time
+SAFETY = 0.5
+# Never sleep longer than this
+LONGEST = 60.0
+
+def fit(points):
+	"""\
+	Least squares fit of y = a + b*x, returns (a, b).
+	"""
+	n = float(len(points))
+	sx  = sum([x for x, y in points])
+	sy  = sum([y for x, y in points])
+	sxx = sum([x*x for x, y in points])
+	sxy = sum([x*y for x, y in points])
+
+	d = n*sxx - sx*sx
+	if d == 0:
+		return sy/n, 0.0
+
+	b = (n*sxy - sx*sy)/d
+	return (sy - b*sx)/n, b
+
+class Scheduler(object):
+	"""\
+	Works out when to start playing a turn.
+
+	history,	List of (universe size, {phase: seconds}) for recent turns
+	turns,		List of (latency, missed, played) for every turn played, latency
+			includes the sleep and played doesn't
+	"""
+	def __init__(self):
+		self.history = []
+		self.turns   = []
+
+		self.received  = None
+		self.deadline  = None
+		self.predicted = None
+
+	def predict(self, size, phases=PHASES):
+		"""\
+		Returns how many seconds the phases of a turn are expected to take, or
+		None if we haven't played any turns yet.
+		"""
+		if len(self.history) == 0:
+			return None
+
+		total = 0.0
+		for phase in phases:
+			a, b = fit([(s, taken.get(phase, 0.0)) for s, taken in self.history])
+			total += max(a + b*size, 0.0)
+		return total
+
+	def start(self, remaining, size):
+		"""\
+		A turn with remaining seconds has started, returns how many seconds
+		to sleep before playing it.
+		"""
+		# We get told the time remaining a few times each turn
+		if self.received is None:
+			self.received = time.time()
+		self.deadline  = time.time() + remaining
+		self.predicted = self.predict(size)
+
+		if self.predicted is None:
+			# Nothing to go on, only use the first third of the turn
+			spare = remaining/3.0
+		else:
+			spare = remaining - self.predicted*(1+SAFETY) - MARGIN
+		if spare <= 0:
+			return 0
+		return random.uniform(0, min(spare, LONGEST))
+
+	def remaining(self, size, phases=PHASES):
+		"""\
+		Returns how many seconds are left before the deadline once the given
+		phases and the safety margin have been allowed for, or None if we
+		don't know the deadline.
+		"""
+		if self.deadline is None:
+			return None
+
+		needed = self.predict(size, phases)
+		if needed is None:
+			needed = 0.0
+		return self.deadline - time.time() - needed*(1+SAFETY) - MARGIN
+
+	def record(self, stats):
+		"""\
+		Learn from a turn which has been played (see Turn.stats).
+		"""
+		phases = stats['phases']
+		self.history.append((stats['size'], phases))
+		del self.history[:-WINDOW]
+
+		if self.received is None:
+			return
+
+		finished = stats['finished']
+		self.turns.append((finished - self.received, finished > self.deadline, sum(phases.values())))
+		self.received = None
+		self.deadline = None
+
+	def status(self):
+		"""\
+		Returns the scheduling metrics as a dictionary.
+		"""
+		s = {'turns': len(self.turns), 'latency': None, 'played': None, 'missed': 0, 'miss rate': 0.0}
+		if len(self.turns) > 0:
+			s['latency']   = self.turns[-1][0]
+			s['played']    = self.turns[-1][2]
+			s['missed']    = len([t for t in self.turns if t[1]])
+			s['miss rate'] = float(s['missed'])/len(self.turns)
+		s['predicted'] = self.predicted
+		return s
+
+	def report(self):
+		s = self.status()
+		if s['latency'] is None:
+			return
+
+		print "This turn finished %.1fs after it started," % s['latency'],
+		print "playing it took %.1fs" % s['played'],
+		if not s['predicted'] is None:
+			print "(predicted %.1fs)" % s['predicted'],
+		print
+		print "Missed %i of %i deadlines (%.0f%%)" % (s['missed'], s['turns'], s['miss rate']*100)
@@ -1,8 +1,24 @@
+import threading
 
 cache      = None
 connection = None
-
-# FIXME: These should be defined in a "profile" somewhere as they are all server specific...
+pool       = None
+intel      = None
+ledger     = None
+profile    = None
+influence  = None
+scheduler  = None
+
+# A weak proxy to the Turn being planned (see turn.py)
+turn       = None
+
+# Per thread connection when issuing orders through the pool (see pool.py)
+local      = threading.local()
+# Held while changing the cache
+lock       = threading.RLock()
+
+# These are only defaults, the real values are server specific and are
+# discovered or loaded from a profile (see ruleset.py)
 PLANET_TYPE = 3
 FLEET_TYPE  = 4
 
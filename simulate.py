@@ -0,0 +1,455 @@
+#! /usr/bin/python
+
+import math
+import time
+import random
+
+import server
+
+"""
+
+The Simulator
+-------------------------------------------------------------------------------
+The planner has no idea if a task which is only 34% assigned will actually
+succeed. The simulator plays a plan forward a few turns on a compact copy of
+the universe so different plans can be compared.
+
+It models,
+ * movement, fleets move at the speed of their slowest ship,
+ * building, ships appear after their build time and carry on with the task,
+ * merging, fleets which reach the fleet they are merging with join it,
+ * assembling, the fleets for a task wait at the flagship until everything
+   which is going to join it has arrived and then attack the target together,
+ * colonisation, a frigate at an undefended planet takes it over,
+ * combat, the side with more power (with some luck) wins and the winner
+   loses ships in proportion to the loser's power.
+
+Enemy fleets are assumed to stay where they are.
+
+Each plan is played a number of times with different luck (the same luck is
+used for every plan so they are compared fairly), the rollouts are spread over
+a process pool and stop when the time runs out.
+
+Running this file benchmarks the simulator on a random universe.
+"""
+
+US     = 0
+ENEMY  = 1
+NOBODY = -1
+
+# How many turns to look ahead
+HORIZON = 10
+# How much luck is involved in combat
+NOISE   = 0.2
+# How much a planet is worth compared to a battleship
+PLANET  = 5.0
+# How many plans which drop a single task to try
+CANDIDATES = 8
+# How many rollouts each process does at once
+BATCH = 4
+
+MOVE     = 'move'
+MERGE    = 'merge'
+WAIT     = 'wait'
+BUILD    = 'build'
+COLONISE = 'colonise'
+
+class Snapshot(object):
+	"""\
+	A compact copy of the universe.
+
+	fleets,		Dictionary of id -> [owner, position, frigates, battleships]
+	planets,	Dictionary of id -> [owner, position]
+	"""
+	def __init__(self):
+		self.fleets  = {}
+		self.planets = {}
+
+		self.speed   = (server.FRIGATE_SPEED, server.BATTLESHIP_SPEED)
+		self.build   = (server.FRIGATE_BUILD, server.BATTLESHIP_BUILD)
+		self.power   = (server.FRIGATE_POWER, server.BATTLESHIP_POWER)
+		self.defence = server.BATTLESHIP_POWER*2
+
+	def add(self, owner, ref):
+		if ref._subtype == server.PLANET_TYPE:
+			self.planets[ref.id] = [owner, tuple(ref.pos)]
+
+		if ref._subtype == server.FLEET_TYPE:
+			frigates, battleships = 0, 0
+			for shipid, num in ref.ships:
+				name = server.cache.designs[shipid].name
+				if name == 'Frigate':
+					frigates += num
+				elif name != 'Scout':
+					battleships += num
+			self.fleets[ref.id] = [owner, tuple(ref.pos), frigates, battleships]
+
+	def from_references(cls, assets, threats, neutrals):
+		snapshot = cls()
+		for owner, things in ((US, assets), (ENEMY, threats), (NOBODY, neutrals)):
+			for thing in things:
+				for ref in thing.refs:
+					snapshot.add(owner, ref)
+		return snapshot
+	from_references = classmethod(from_references)
+
+def plan(tasks):
+	"""\
+	Turn the assignments of the given tasks into a dictionary of
+	asset id -> list of actions, the same way Task.issue would (and the
+	later turns would once a task has assembled).
+	"""
+	from tasks import Task
+
+	def target(task):
+		for ref in task.refs[0].refs:
+			if ref._subtype == server.PLANET_TYPE:
+				return ref.id
+		return None
+
+	def builds(task, followup):
+		frigates    = int(task.type in (Task.COLONISE, Task.TAKEOVER))
+		battleships = int(task.type in (Task.DESTROY, Task.TAKEOVER))
+		return [(BUILD, frigates, battleships, followup)]
+
+	actions = {}
+	for key, task in enumerate(tasks):
+		fulfilments = task.fulfilments()
+		if len(fulfilments) == 0:
+			continue
+
+		attack = [(MOVE, tuple(task.ref.pos[0]))]
+		if task.type in (Task.COLONISE, Task.TAKEOVER):
+			attack.append((COLONISE, target(task)))
+
+		if len(fulfilments) == 1 and task.portion() >= 100:
+			fulfilment = fulfilments[0]
+			if fulfilment.direct:
+				actions[fulfilment.asset.ref.id] = attack
+			else:
+				actions[fulfilment.asset.ref.id] = builds(task, attack)
+			continue
+
+		# Everything assembles at the flagship, which attacks once the
+		# rest have arrived (or have been merged into it)
+		flagship, flagbuilt = task.flagship()
+		assemble = [(MOVE, tuple(flagship.ref.pos))]
+		for fulfilment in fulfilments:
+			if not fulfilment.direct:
+				actions[fulfilment.asset.ref.id] = builds(task, assemble + [(WAIT, key)] + attack)
+			elif flagbuilt and not fulfilment.asset is flagship:
+				actions[fulfilment.asset.ref.id] = assemble + [(MERGE, flagship.ref.id, key)]
+			else:
+				actions[fulfilment.asset.ref.id] = assemble + [(WAIT, key)] + attack
+	return actions
+
+def candidates(tasks):
+	"""\
+	Returns a list of (name, tasks) for the plans worth comparing.
+	"""
+	tasks   = list(tasks)
+	partial = [task for task in tasks if task.portion() < 100]
+
+	r = [("everything", tasks)]
+	if len(partial) > 0:
+		r.append(("only complete tasks", [task for task in tasks if task.portion() >= 100]))
+	for task in partial[:CANDIDATES]:
+		r.append(("without %s" % task.__str__(True), [t for t in tasks if not t is task]))
+	return r
+
+def step(pos, to, distance):
+	d = math.sqrt(sum([(a-b)**2 for a, b in zip(pos, to)]))
+	if d <= distance:
+		return tuple(to)
+	return tuple([a+(b-a)*distance/d for a, b in zip(pos, to)])
+
+def rollout(snapshot, actions, seed, horizon=HORIZON):
+	"""\
+	Play the actions forward and return how good the result is.
+	"""
+	luck = random.Random(seed)
+
+	fp, bp = snapshot.power
+	def power(fleet):
+		return fleet[2]*fp + fleet[3]*bp
+
+	fleets  = dict([(id, list(f)) for id, f in snapshot.fleets.items()])
+	planets = dict([(id, list(p)) for id, p in snapshot.planets.items()])
+	orders  = dict([(id, list(a)) for id, a in actions.items()])
+	queue   = []
+	new     = -1
+
+	def assembling(actions, key):
+		# Is something still going to join the task's flagship
+		for action in actions:
+			if action[0] in (WAIT, MERGE) and action[-1] == key:
+				return True
+			if action[0] == BUILD and assembling(action[3], key):
+				return True
+		return False
+
+	def arriving(key):
+		for id, actions in orders.items():
+			if len(actions) == 0 or actions[0] == (WAIT, key):
+				continue
+			if fleets.has_key(id) or (planets.has_key(id) and planets[id][0] == US):
+				if assembling(actions, key):
+					return True
+		for build in queue:
+			if assembling(build[4], key):
+				return True
+		return False
+
+	for turn in range(horizon):
+		# Start and finish building
+		for id, planet in planets.items():
+			if planet[0] != US or len(orders.get(id, [])) == 0 or orders[id][0][0] != BUILD:
+				continue
+			what, frigates, battleships, followup = orders[id].pop(0)
+			turns = snapshot.build[0]*frigates + snapshot.build[1]*battleships
+			queue.append([turns, planet[1], frigates, battleships, followup])
+
+		for build in queue[:]:
+			build[0] -= 1
+			if build[0] > 0:
+				continue
+			queue.remove(build)
+			fleets[new] = [US, build[1], build[2], build[3]]
+			orders[new] = list(build[4])
+			new -= 1
+
+		# Attack once everything has assembled
+		ready = {}
+		for id in fleets.keys():
+			if len(orders.get(id, [])) == 0 or orders[id][0][0] != WAIT:
+				continue
+			key = orders[id][0][1]
+			if not ready.has_key(key):
+				ready[key] = not arriving(key)
+			if ready[key]:
+				orders[id].pop(0)
+
+		# Move and merge
+		colonising = []
+		for id in fleets.keys():
+			if not fleets.has_key(id) or len(orders.get(id, [])) == 0:
+				continue
+			fleet  = fleets[id]
+			action = orders[id][0]
+			speed  = snapshot.speed[fleet[2] == 0]
+
+			if action[0] == MOVE:
+				fleet[1] = step(fleet[1], action[1], speed)
+				if fleet[1] == action[1]:
+					orders[id].pop(0)
+
+			elif action[0] == MERGE:
+				if action[1] == id or not fleets.has_key(action[1]):
+					orders[id].pop(0)
+					continue
+				flagship = fleets[action[1]]
+				fleet[1] = step(fleet[1], flagship[1], speed)
+				if fleet[1] == flagship[1]:
+					flagship[2] += fleet[2]
+					flagship[3] += fleet[3]
+					del fleets[id]
+
+			elif action[0] == COLONISE:
+				colonising.append(id)
+
+		# Combat
+		located = {}
+		for id, fleet in fleets.items():
+			if fleet[0] != NOBODY:
+				located.setdefault(fleet[1], [[], []])[fleet[0] == ENEMY].append(id)
+		defended = {}
+		for id, planet in planets.items():
+			if planet[0] == ENEMY:
+				defended[planet[1]] = snapshot.defence
+
+		for pos, (ours, theirs) in located.items():
+			if len(ours) == 0 or (len(theirs) == 0 and not defended.has_key(pos)):
+				continue
+
+			us   = sum([power(fleets[id]) for id in ours])
+			them = sum([power(fleets[id]) for id in theirs]) + defended.get(pos, 0)
+			if them == 0:
+				continue
+
+			us   *= luck.uniform(1-NOISE, 1+NOISE)
+			them *= luck.uniform(1-NOISE, 1+NOISE)
+			if us > them:
+				losers, winners, ratio = theirs, ours, them/us
+				if defended.has_key(pos):
+					del defended[pos]
+			else:
+				losers, winners, ratio = ours, theirs, us/them
+
+			for id in losers:
+				del fleets[id]
+			for id in winners:
+				fleets[id][2] = int(round(fleets[id][2]*(1-ratio)))
+				fleets[id][3] = int(round(fleets[id][3]*(1-ratio)))
+
+		# Colonise
+		for id in colonising:
+			if not fleets.has_key(id):
+				continue
+			fleet  = fleets[id]
+			planet = planets.get(orders[id][0][1], None)
+			if planet is None or planet[0] == US or fleet[2] == 0:
+				orders[id].pop(0)
+				continue
+			if fleet[1] != planet[1] or defended.has_key(planet[1]):
+				continue
+			for other in located.get(planet[1], [[], []])[1]:
+				if fleets.has_key(other):
+					break
+			else:
+				planet[0] = US
+				fleet[2] -= 1
+				orders[id].pop(0)
+
+	score = 0.0
+	for planet in planets.values():
+		score += PLANET*[0, 1][planet[0] == US]
+	for fleet in fleets.values():
+		score += power(fleet)*[-1, 1][fleet[0] == US]
+	return score
+
+# Set in each worker process so the snapshot is only sent once
+_work = None
+
+def _init(snapshot, plans, horizon):
+	global _work
+	_work = (snapshot, plans, horizon)
+
+def _job(job):
+	snapshot, plans, horizon = _work
+	i, seeds = job
+	return [(i, rollout(snapshot, plans[i], seed, horizon)) for seed in seeds]
+
+def evaluate(snapshot, plans, rollouts, deadline, processes=None, horizon=HORIZON):
+	"""\
+	Play each plan rollouts times (or until deadline seconds have passed).
+
+	Returns (average score for each plan, number of rollouts, rollouts/second).
+	"""
+	start = time.time()
+	def jobs():
+		for first in xrange(0, rollouts, BATCH):
+			for i in xrange(len(plans)):
+				yield i, range(first, min(first+BATCH, rollouts))
+
+	results = []
+	if processes != 1:
+		try:
+			import multiprocessing
+
+			p = multiprocessing.Pool(processes, _init, (snapshot, plans, horizon))
+			try:
+				r = p.imap_unordered(_job, jobs())
+				while True:
+					remaining = deadline - (time.time() - start)
+					if remaining <= 0:
+						break
+					try:
+						results.extend(r.next(remaining))
+					except (StopIteration, multiprocessing.TimeoutError):
+						break
+			finally:
+				p.terminate()
+		except (ImportError, OSError), e:
+			print "(WARNING: Unable to simulate in parallel, %s)" % e
+			processes = 1
+
+	if processes == 1:
+		_init(snapshot, plans, horizon)
+		for job in jobs():
+			if time.time() - start > deadline:
+				break
+			results.extend(_job(job))
+
+	scores = [[] for plan in plans]
+	for i, score in results:
+		scores[i].append(score)
+
+	averages = []
+	for s in scores:
+		if len(s) == 0:
+			averages.append(float('-inf'))
+		else:
+			averages.append(sum(s)/len(s))
+
+	taken = time.time() - start
+	return averages, len(results), len(results)/max(taken, 1e-6)
+
+def best(tasks, snapshot, rollouts, deadline):
+	"""\
+	Simulate the candidate plans for the tasks and returns the tasks in the
+	best one.
+	"""
+	options = candidates(tasks)
+	plans   = [plan(t) for name, t in options]
+
+	scores, done, rate = evaluate(snapshot, plans, rollouts, deadline)
+	print "Simulated %i rollouts (%.1f rollouts/s)" % (done, rate)
+
+	for (name, t), score in zip(options, scores):
+		print "  %8.2f %s" % (score, name)
+
+	i = scores.index(max(scores))
+	print "Using the plan with %s" % options[i][0]
+	return options[i][1]
+
+def synthetic(n, seed=0):
+	"""\
+	Returns a random snapshot with n objects, for benchmarking.
+	"""
+	luck = random.Random(seed)
+	def pos():
+		return (luck.uniform(0, 1e10), luck.uniform(0, 1e10), 0.0)
+
+	snapshot = Snapshot()
+	for id in range(n):
+		owner = luck.choice((US, ENEMY, NOBODY))
+		if luck.random() < 0.5:
+			snapshot.planets[id] = [owner, pos()]
+		elif owner != NOBODY:
+			snapshot.fleets[id] = [owner, pos(), luck.randint(0, 3), luck.randint(0, 3)]
+	return snapshot
+
+def random_plan(snapshot, seed=0):
+	"""\
+	Returns a plan where our planets build and our fleets colonise random
+	planets, for benchmarking.
+	"""
+	luck    = random.Random(seed)
+	planets = [id for id, p in snapshot.planets.items() if p[0] != US]
+	if len(planets) == 0:
+		return {}
+
+	actions = {}
+	for id, planet in snapshot.planets.items():
+		if planet[0] == US:
+			target = luck.choice(planets)
+			actions[id] = [(BUILD, 1, 0, [(MOVE, snapshot.planets[target][1]), (COLONISE, target)])]
+	for id, fleet in snapshot.fleets.items():
+		if fleet[0] == US:
+			target = luck.choice(planets)
+			actions[id] = [(MOVE, snapshot.planets[target][1]), (COLONISE, target)]
+	return actions
+
+def benchmark(snapshot, seconds=5.0, processes=None):
+	"""\
+	Print how many rollouts per second the simulator can do.
+	"""
+	actions = random_plan(snapshot)
+
+	n = len(snapshot.fleets) + len(snapshot.planets)
+	for p in (1, processes):
+		scores, done, rate = evaluate(snapshot, [actions], 10**9, seconds, p)
+		print "%i objects, %s processes: %.1f rollouts/s" % (n, [p, "all"][p is None], rate)
+
+if __name__ == "__main__":
+	benchmark(synthetic(500))
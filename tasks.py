@@ -1,6 +1,7 @@
 
 import server
 from things import Reference, Asset, OrderCreate, OrderRemove, dist
+from things import CAN_BUILD, CAN_MOVE, CAN_COLONISE, HAS_POWER
 
 """
 
@@ -54,6 +55,9 @@ class Role(object):
 	def __init__(self):
 		self.fulfilment = None
 
+		if not server.turn is None:
+			server.turn.allocate()
+
 	def assign(self, f):
 		# FIXME: This does not work with an asset which must have multiple roles fulfilled.
 		if not isinstance(f, Task.Fulfilment):
@@ -85,7 +89,7 @@ class Coloniser(Role):
 	"""
 	def check(self, f):
 		# Check that the object can colonise a planet...		
-		return server.COLONISE_ORDER in f.asset.ref.order_types or not f.direct
+		return f.asset.capabilities() & CAN_COLONISE or not f.direct
 
 
 class Task(Reference):
@@ -126,6 +130,9 @@ class Task(Reference):
 			self.portion = portion
 			self.direct  = direct
 
+			if not server.turn is None:
+				server.turn.allocate()
+
 		def __str__(self):
 			if self.direct:
 				brackets = " [%s]"
@@ -330,6 +337,12 @@ class Task(Reference):
 				break
 			keys.pop(0)
 
+		# Prefer the closest place to assemble which the enemy doesn't control
+		if not server.influence is None:
+			for key in keys:
+				if server.influence.safety(distances[key][0].ref.pos) >= 0:
+					return distances[key]
+
 		return distances[keys[0]]
 
 	def issue(self):
@@ -371,6 +384,7 @@ class Task(Reference):
 
 class TaskDestroy(Task):
 	name = 'Destroy '
+	requires = HAS_POWER
 
 	def issue(self):
 		"""\
@@ -399,6 +413,7 @@ class TaskDestroy(Task):
 
 class TaskColonise(Task):
 	name = 'Colonise'
+	requires = CAN_COLONISE
 
 	def __init__(self, ref):
 		Task.__init__(self, ref, [Coloniser()])
@@ -428,6 +443,7 @@ class TaskColonise(Task):
 
 class TaskTakeOver(TaskColonise):
 	name = 'TakeOver'
+	requires = HAS_POWER
 
 	def issue(self):
 		# First job is to collect all the assets together
@@ -458,6 +474,39 @@ Task.COLONISE = TaskColonise
 Task.TAKEOVER = TaskTakeOver
 Task.types = (Task.DESTROY, Task.COLONISE, Task.TAKEOVER)
 
+def capable(assets, tasks, candidates=None):
+	"""\
+	Returns a dictionary of the tasks each asset is capable of doing.
+
+	An asset which can build can do anything, otherwise it needs everything
+	in the task's requires mask and has to be able to move if the task is
+	somewhere else. The tasks are only checked once for each different mask.
+
+	candidates(asset) returns the tasks to check for that asset (defaults to
+	all the tasks).
+	"""
+	checked = {}
+
+	r = {}
+	for asset in assets:
+		mask = asset.capabilities()
+
+		possible = tasks
+		if not candidates is None:
+			possible = candidates(asset)
+
+		key = (id(possible), mask)
+		if not checked.has_key(key):
+			checked[key] = [task for task in possible \
+				if mask & CAN_BUILD or mask & task.requires == task.requires]
+		possible = checked[key]
+
+		if not mask & (CAN_BUILD | CAN_MOVE):
+			possible = [task for task in possible if task.ref.pos[0] == asset.ref.pos]
+
+		r[asset] = possible
+	return r
+
 def OrderPrint(asset):
 	"""\
 	Print out the order completion time...
@@ -6,6 +6,7 @@ from tp.netlib.client import url2bits
 from tp.client.cache import Cache
 
 import server
+from influence import FRIENDLY
 
 version = (0, 0, 1)
 
@@ -38,16 +39,29 @@ def apply(self, evt):
 	else:
 		raise ValueError("Can't deal with that yet!")
 
+def connection():
+	"""\
+	Returns the connection orders should be sent on by this thread.
+	"""
+	return getattr(server.local, 'connection', server.connection)
+
+def OrderApply(event):
+	connection().apply(event)
+
+	server.lock.acquire()
+	try:
+		server.cache.apply(event)
+		if not server.ledger is None:
+			server.ledger.apply(event)
+	finally:
+		server.lock.release()
+
 def OrderCreate(oid, slot, type, *args):
 	order = objects.Order(0, oid, slot, type, 0, [], *args)
-	event = server.cache.CacheDirtyEvent("orders", "create", oid, slot, order)
-	server.connection.apply(event)
-	server.cache.apply(event)
+	OrderApply(server.cache.CacheDirtyEvent("orders", "create", oid, slot, order))
 
 def OrderRemove(oid, slot):
-	event = server.cache.CacheDirtyEvent("orders", "remove", oid, slot, None)
-	server.connection.apply(event)
-	server.cache.apply(event)
+	OrderApply(server.cache.CacheDirtyEvent("orders", "remove", oid, slot, None))
 
 class LayeredIn(list):
 	def __contains__(self, value):
@@ -68,6 +82,9 @@ class Reference(object):
 
 		self.refs = refs
 
+		if not server.turn is None:
+			server.turn.allocate()
+
 	def __str__(self, short=False):
 		s = ""
 		for ref in self.refs:
@@ -143,15 +160,59 @@ class Reference(object):
 
 MARGIN = 5
 
+# How many turns before a threat must be dealt with
+SHIP_URGENCY   = 2.0
+PLANET_URGENCY = 8.0
+
+# Up to how much more force a threat needs when it is near our assets
+PROXIMITY    = 0.5
+# How much more force a threat needs for each recent report about it
+ENGAGED      = 0.25
+# Only count this many reports
+MOST_ENGAGED = 4
+
+# What an asset is capable of doing (see Asset.capabilities)
+CAN_BUILD    = 1
+CAN_MOVE     = 2
+CAN_COLONISE = 4
+HAS_POWER    = 8
+
 class Asset(Reference):
 	"""\
 	An asset is anything which has value to the computer.
 	"""
 
+	def capabilities(self):
+		"""\
+		Returns a bitmask of what this asset can do.
+		"""
+		# Only worked out once per turn
+		if self.__dict__.has_key('_mask'):
+			return self._mask
+
+		types = self.ref.order_types
+
+		mask = 0
+		if server.BUILDFLEET_ORDER in types:
+			mask |= CAN_BUILD
+		if server.MOVE_ORDER in types:
+			mask |= CAN_MOVE
+		if server.COLONISE_ORDER in types:
+			mask |= CAN_COLONISE
+		if self.power() > 0:
+			mask |= HAS_POWER
+
+		self._mask = mask
+		return self._mask
+
 	def power(self):
 		"""\
 		Returns how powerful an object is.
 		"""
+		# Only worked out once per turn
+		if self.__dict__.has_key('_power'):
+			return self._power
+
 		# A Planet is always has no power
 		# A fleet is as powerful as the sum of it parts
 
@@ -176,7 +237,8 @@ class Asset(Reference):
 
 					print "WARNING! Unknown ship type!"
 
-		return power
+		self._power = power
+		return self._power
 
 	def ref(self):
 		return self.refs[0]
@@ -202,12 +264,45 @@ class Threat(Reference):
 		The first value is how threatening the object is in "absolute" terms.
 		The second value is how soon this threat must be delt with.
 		"""
+		# Only worked out once per turn
+		if self.__dict__.has_key('_threat'):
+			return self._threat
+
+		pos   = self.refs[0].pos
+		power = self.power()
+
+		#	Unarmed ships are ignored
+		if power == 0:
+			self._threat = (0.0, float('inf'))
+			return self._threat
+
 		# Planets are more threatening but can be dealt with over a longer period of time
 		# Ships are less threatening but are more urgent
-		#	Unarmed ships are ignored
-		#   Big groups of ships are more important
-		# Threats which are closer to assets are more threatening
-		pass
+		soon = [SHIP_URGENCY, PLANET_URGENCY][server.PLANET_TYPE in self._subtype]
+
+		if not server.influence is None:
+			# Big groups of ships are more important
+			power += server.influence.reinforcement(pos, power)
+
+			# Threats which are closer to assets are more threatening
+			friendly = max(server.influence.at(FRIENDLY, pos), 0.0)
+			power   *= 1.0 + PROXIMITY*friendly/(friendly + power)
+
+		# Threats which have been active recently need more force to deal with
+		power *= 1.0 + ENGAGED*min(self.engagements(), MOST_ENGAGED)
+
+		self._threat = (power, soon)
+		return self._threat
+
+	def engagements(self):
+		"""\
+		Returns how many combat, colonisation and loss reports have mentioned
+		this threat recently.
+		"""
+		if server.intel is None:
+			return 0
+
+		return sum([server.intel.count(threat.id) for threat in self.refs])
 
 	def power(self):
 		"""\
@@ -0,0 +1,172 @@
+
+import gc
+import time
+import weakref
+
+try:
+	import resource
+except ImportError:
+	resource = None
+
+import server
+
+"""
+
+The Turn
+-------------------------------------------------------------------------------
+Records how long each phase of a turn took and how much memory it used. The
+planning structures (Assets, Threats, Neutrals, Tasks, Roles and Fulfilments)
+don't refer back to each other, so they are freed by reference counting as
+soon as nothing uses them. Each one only bumps a counter on the Turn so we know
+how many were created.
+
+Because of that the forced gc.collect() between turns can be turned off
+(--gc=off), made cheaper (--gc=0, --gc=1) or used to check nothing was leaked
+into cycles (--gc=check).
+"""
+
+# Check the resident memory every this many planning structures
+SAMPLE = 1024
+
+# The --gc modes, "off", "check" or the generation to collect
+MODES = ("off", "check", "0", "1", "2")
+
+def rss():
+	"""\
+	Returns the current resident memory in kilobytes (or None).
+	"""
+	if resource is None:
+		return None
+
+	try:
+		f = open('/proc/self/statm')
+		try:
+			pages = int(f.read().split()[1])
+		finally:
+			f.close()
+	except (IOError, ValueError, IndexError):
+		return None
+	return pages * resource.getpagesize() / 1024
+
+class Turn(object):
+	"""\
+	The statistics for a single turn.
+
+	allocated,	How many planning structures have been created this turn
+	peak,		The most resident memory seen during this turn (kilobytes)
+	"""
+	def __init__(self):
+		self.allocated = 0
+
+		self.started = time.time()
+		self.before  = rss()
+		self.after   = None
+		self.peak    = self.before
+
+		self.released = False
+
+		# How long each phase of the turn took
+		self.phases   = {}
+		self.finished = self.started
+		# How many objects are in the universe
+		self.size     = 0
+
+		server.turn = weakref.proxy(self)
+
+	def allocate(self):
+		"""\
+		Count a planning structure being created.
+		"""
+		self.allocated += 1
+		if self.allocated % SAMPLE == 0:
+			self.sample()
+
+	def sample(self):
+		"""\
+		Check the resident memory for the peak of this turn.
+		"""
+		now = rss()
+		if not now is None and (self.peak is None or now > self.peak):
+			self.peak = now
+		return now
+
+	def mark(self, phase):
+		"""\
+		Record that a phase of the turn has finished.
+		"""
+		now = time.time()
+		self.phases[phase] = now - self.finished
+		self.finished = now
+
+		self.sample()
+
+	def release(self):
+		"""\
+		Finish the turn, recording the memory used.
+		"""
+		self.after = self.sample()
+		self.released = True
+		server.turn = None
+
+	def stats(self):
+		"""\
+		Returns the memory used by this turn as a dictionary.
+
+		allocated,	Planning structures created
+		peak,		Most resident memory seen this turn (kilobytes)
+		growth,		Growth in resident memory (kilobytes)
+		time,		How long the turn took (seconds)
+		phases,		Dictionary of phase -> how long it took (seconds)
+		finished,	When the last phase finished
+		size,		How many objects are in the universe
+		"""
+		if not self.released:
+			raise SyntaxError("Turn has not been released yet!")
+
+		s = {
+			'allocated': self.allocated,
+			'peak':      self.peak,
+			'growth':    None,
+			'time':      time.time() - self.started,
+			'phases':    dict(self.phases),
+			'finished':  self.finished,
+			'size':      self.size,
+		}
+		if not self.after is None and not self.before is None:
+			s['growth'] = self.after - self.before
+		return s
+
+	def report(self):
+		s = self.stats()
+		print "This turn used:"
+		print "  %8i planning structures" % s['allocated']
+		if not s['peak'] is None:
+			print "  %8i kB peak memory" % s['peak']
+		if not s['growth'] is None:
+			print "  %8i kB memory growth" % s['growth']
+
+def collect(mode):
+	"""\
+	Do the forced garbage collection between turns.
+
+	mode is one of MODES.
+	Returns the number of objects collected and the number of those which
+	were planning structures.
+	"""
+	if mode == "off":
+		return 0, 0
+
+	if mode != "check":
+		return gc.collect(int(mode)), 0
+
+	from things import Reference
+	from tasks import Task, Role
+
+	gc.set_debug(gc.DEBUG_SAVEALL)
+	try:
+		collected = gc.collect()
+		leaked = len([o for o in gc.garbage if isinstance(o, (Reference, Role, Task.Fulfilment))])
+		del gc.garbage[:]
+	finally:
+		gc.set_debug(0)
+	return collected, leaked